@@ -0,0 +1,70 @@
+import argparse
+import copy
+import time
+
+import torch
+
+from utils.cnn_model import get_model
+from utils.train import train
+from utils.eval import test
+from utils.accel import prepare_model
+
+# name -> (bf16 autocast, channels_last, torch.compile)
+MODES = {
+    "fp32": (False, False, False),
+    "bf16": (True, False, False),
+    "channels_last": (False, True, False),
+    "bf16+channels_last": (True, True, False),
+    "compile": (False, False, True),
+    "bf16+channels_last+compile": (True, True, True),
+}
+
+
+def synthetic_batches(steps, batch_size):
+    return [
+        (torch.rand(batch_size, 3, 224, 224), torch.randint(0, 2, (batch_size,)))
+        for _ in range(steps)
+    ]
+
+
+def images_per_sec(fn, batches, warmup):
+    # Warm-up batches absorb compilation and allocator start-up
+    fn(batches[:warmup])
+    start = time.perf_counter()
+    fn(batches[warmup:])
+    elapsed = time.perf_counter() - start
+    return sum(len(labels) for _, labels in batches[warmup:]) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Images/sec of each CPU training/eval mode")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    base_model = get_model()
+    batches = synthetic_batches(args.warmup + args.steps, args.batch_size)
+
+    print(f"{'mode':<28}{'train img/s':>14}{'eval img/s':>14}")
+    for name in args.modes:
+        amp, channels_last, use_compile = MODES[name]
+        model = copy.deepcopy(base_model)
+        net = prepare_model(model, channels_last=channels_last, use_compile=use_compile)
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.001, momentum=0.9)
+
+        train_ips = images_per_sec(
+            lambda b: train(net, b, optimizer, device, amp=amp, channels_last=channels_last),
+            batches, args.warmup,
+        )
+        eval_ips = images_per_sec(
+            lambda b: test(net, b, device, amp=amp, channels_last=channels_last),
+            batches, args.warmup,
+        )
+        print(f"{name:<28}{train_ips:>14.1f}{eval_ips:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,190 @@
 import argparse
-import os.path
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import flwr as fl
 import torch
+from flwr.common import (
+    Code, EvaluateRes, FitRes, GetParametersRes, Status, ndarrays_to_parameters, parameters_to_ndarrays,
+)
 
-from utils.cnn_model import get_model
+from utils.cnn_model import WEIGHTS_PATH, get_model
 from utils.train import train
 from utils.eval import test
 
 from utils.dataset import get_loaders
+from utils.params import parameter_keys, get_parameters, set_parameters
+from utils.accel import prepare_model
 
 
-# Parse command-line arguments
-parser = argparse.ArgumentParser(description="Federated client for pneumonia detection")
-parser.add_argument("--clinic", type=str, required=True, help="Clinic ID: a, b, or c")
-args = parser.parse_args()
+class FlowerClient(fl.client.NumPyClient):
+    # Parameters are exchanged through `model`, training runs through `net`
+    # (the compiled / channels_last wrapper, or `model` itself)
+    def __init__(self, model, trainloader, testloader, device, param_keys,
+                 net=None, amp=False, channels_last=False):
+        self.model = model
+        self.net = net if net is not None else model
+        self.trainloader = trainloader
+        self.testloader = testloader
+        self.device = device
+        self.param_keys = param_keys
+        self.amp = amp
+        self.channels_last = channels_last
 
-# Set clinic path
-clinic_id = args.clinic.lower()
-data_path = os.path.join('datasets', clinic_id)
+    def get_parameters(self, config):
+        return get_parameters(self.model, self.param_keys)
 
-print("Using cuda:", torch.cuda.is_available())
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = get_model().to(DEVICE)
-trainloader, testloader = get_loaders(data_path)
+    def fit(self, parameters, config):
+        start = time.perf_counter()
+        set_parameters(self.model, parameters, self.param_keys)
+        param_copy_in = time.perf_counter() - start
 
-def set_parameters(parameters):
-    state_dict = model.state_dict()
-    for k, v in zip(state_dict.keys(), parameters):
-        state_dict[k] = torch.tensor(v)
-    model.load_state_dict(state_dict)
+        optimizer = torch.optim.SGD(self.model.parameters(), lr=0.001, momentum=0.9)
+        # The server sends 0 for "no limit", Flower config values cannot be None
+        stats = train(self.net, self.trainloader, optimizer, self.device,
+                      amp=self.amp, channels_last=self.channels_last,
+                      epochs=int(config.get("local_epochs", 1)),
+                      max_steps=int(config.get("max_steps", 0)) or None,
+                      time_budget=float(config.get("time_budget", 0)) or None)
 
+        copy_start = time.perf_counter()
+        new_parameters = self.get_parameters(config={})
+        end = time.perf_counter()
+
+        metrics = {k: float(v) for k, v in stats.items()}
+        metrics["param_copy_in"] = param_copy_in
+        metrics["param_copy_out"] = end - copy_start
+        metrics["fit_time"] = end - start
+
+        # Weighted by the samples actually trained on, so budgets and local epochs
+        # count the same way for every clinic
+        return new_parameters, int(stats["samples"]), metrics
+
+    def evaluate(self, parameters, config):
+        set_parameters(self.model, parameters, self.param_keys)
+        accuracy = test(self.net, self.testloader, self.device,
+                        amp=self.amp, channels_last=self.channels_last)
+        print(f"[Client] Evaluation -> Accuracy: {accuracy:.4f}")
+
+        return 0.0, len(self.testloader.dataset), {"accuracy": float(accuracy)}
+
+
+class TimedClient(fl.client.Client):
+    """Does Flower's parameter (de)serialisation around a FlowerClient, so it is timed in the fit metrics."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_parameters(self, ins):
+        parameters = ndarrays_to_parameters(self.client.get_parameters(ins.config))
+        return GetParametersRes(status=Status(code=Code.OK, message=""), parameters=parameters)
+
+    def fit(self, ins):
+        start = time.perf_counter()
+        parameters = parameters_to_ndarrays(ins.parameters)
+        deserialise = time.perf_counter() - start
+
+        ndarrays, num_examples, metrics = self.client.fit(parameters, ins.config)
+
+        serialise_start = time.perf_counter()
+        encoded = ndarrays_to_parameters(ndarrays)
+        metrics["serialise"] = time.perf_counter() - serialise_start
+        metrics["deserialise"] = deserialise
+        return FitRes(status=Status(code=Code.OK, message=""), parameters=encoded,
+                      num_examples=num_examples, metrics=metrics)
+
+    def evaluate(self, ins):
+        loss, num_examples, metrics = self.client.evaluate(parameters_to_ndarrays(ins.parameters), ins.config)
+        return EvaluateRes(status=Status(code=Code.OK, message=""), loss=loss,
+                           num_examples=num_examples, metrics=metrics)
+
+
+class LazyFlowerClient(FlowerClient):
+    """Registers with the server right away while `build` loads the model and data in the background.
+
+    `build` returns the FlowerClient constructor arguments, the first request waits for it.
+    If `build` fails the process exits, so the server does not keep a dead clinic registered.
+    """
+
+    def __init__(self, build):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._loading = executor.submit(build)
+        self._loading.add_done_callback(self._exit_on_failure)
+        executor.shutdown(wait=False)
+
+    @staticmethod
+    def _exit_on_failure(future):
+        error = future.exception()
+        if error is not None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+            print("[Client] Loading the model or data failed, disconnecting")
+            # start_numpy_client blocks the main thread, only a hard exit drops the connection
+            os._exit(1)
+
+    def _wait(self):
+        if self._loading is not None:
+            super().__init__(**self._loading.result())
+            self._loading = None
 
-class FlowerClient(fl.client.NumPyClient):
     def get_parameters(self, config):
-        return [val.cpu().numpy() for val in model.state_dict().values()]
+        self._wait()
+        return super().get_parameters(config)
 
     def fit(self, parameters, config):
-        set_parameters(parameters)
-        optimizer = torch.optim.SGD(model.parameters(), lr=0.001, momentum=0.9)
-        train(model, trainloader, optimizer, DEVICE)
-        return self.get_parameters(config={}), len(trainloader.dataset), {}
+        self._wait()
+        return super().fit(parameters, config)
 
     def evaluate(self, parameters, config):
-        set_parameters(parameters)
-        accuracy = test(model, testloader, DEVICE)
-        print(f"[Client] Evaluation -> Accuracy: {accuracy:.4f}")
+        self._wait()
+        return super().evaluate(parameters, config)
+
+
+def main():
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description="Federated client for pneumonia detection")
+    parser.add_argument("--clinic", type=str, required=True, help="Clinic ID: a, b, or c")
+    parser.add_argument("--data", type=str, default=None,
+                        help="Dataset folder or manifest .csv (default: datasets/<clinic>)")
+    parser.add_argument("--trainable-only", action="store_true",
+                        help="Exchange only trainable weights, keep BatchNorm statistics local "
+                             "(must match on every clinic)")
+    parser.add_argument("--bf16", action="store_true", help="Train and evaluate under bfloat16 autocast")
+    parser.add_argument("--channels-last", action="store_true", help="Use the channels_last memory format")
+    parser.add_argument("--compile", action="store_true", help="Compile the model once with torch.compile")
+    parser.add_argument("--allow-download", action="store_true",
+                        help="Download the pretrained weights when the local weight store is missing")
+    args = parser.parse_args()
+
+    # Fail at launch rather than in the background loader once the server is waiting
+    if not os.path.exists(WEIGHTS_PATH) and not args.allow_download:
+        parser.error(f"no local weights at {os.path.abspath(WEIGHTS_PATH)}, create them with "
+                     f"'python -m utils.cnn_model' or pass --allow-download")
+
+    # Set clinic path
+    clinic_id = args.clinic.lower()
+    data_path = args.data or os.path.join('datasets', clinic_id)
+    if os.path.isdir(data_path):
+        missing = [split for split in ("train", "test") if not os.path.isdir(os.path.join(data_path, split))]
+        if missing:
+            parser.error(f"{data_path} has no {' / '.join(missing)} folder")
+    elif not os.path.isfile(data_path):
+        parser.error(f"no dataset folder or manifest at {data_path}")
+
+    def build():
+        print("Using cuda:", torch.cuda.is_available())
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = get_model().to(device)
+        trainloader, testloader = get_loaders(data_path)
+        param_keys = parameter_keys(model, include_buffers=not args.trainable_only)
+        net = prepare_model(model, channels_last=args.channels_last, use_compile=args.compile)
+        print(f"[Client] Clinic {clinic_id} ready: {len(trainloader.dataset)} train images")
+        return dict(model=model, trainloader=trainloader, testloader=testloader, device=device,
+                    param_keys=param_keys, net=net, amp=args.bf16, channels_last=args.channels_last)
 
-        return 0.0, len(testloader.dataset), {"accuracy": float(accuracy)}
+    client = TimedClient(LazyFlowerClient(build))
+    fl.client.start_client(server_address="localhost:8080", client=client)
 
 if __name__ == "__main__":
-    fl.client.start_numpy_client(server_address="localhost:8080", client=FlowerClient())
+    main()
@@ -1,21 +1,110 @@
+import argparse
+import csv
 import os
 import shutil
+import string
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-folders = [
-    'a',
-    'b',
-    'c'
-]
+from torchvision.datasets.folder import IMG_EXTENSIONS
 
-count = 0
-for test_type in ["train", "test"]:
-    for result in ["NORMAL", "PNEUMONIA"]:
-        folder = f"all\\{test_type}\\{result}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils.partition import SPLITS, partition  # noqa: E402
 
-        for image in os.listdir(folder):
-            file = os.path.join(folder, image)
-            dest_file = f"{folders[count]}\\{test_type}\\{result}\\{image}"
+SPLIT_NAMES = ["train", "test"]
 
-            shutil.copy(file, dest_file)
 
-            count = (count + 1) % 3
\ No newline at end of file
+def clinic_names(num_clients):
+    # a, b, c, ... keeps `clinic.py --clinic a` working
+    if num_clients <= len(string.ascii_lowercase):
+        return list(string.ascii_lowercase[:num_clients])
+    return [f"clinic{i}" for i in range(num_clients)]
+
+
+def list_images(folder):
+    return sorted(e.path for e in os.scandir(folder)
+                  if e.is_file() and e.name.lower().endswith(IMG_EXTENSIONS))
+
+
+def scan(source, executor):
+    """Return {split: (classes, [(path, target), ...])}, one listing task per class folder."""
+    index = {}
+    for split in SPLIT_NAMES:
+        root = os.path.join(source, split)
+        classes = sorted(e.name for e in os.scandir(root) if e.is_dir())
+        listings = executor.map(list_images, [os.path.join(root, c) for c in classes])
+        samples = [(path, target) for target, paths in enumerate(listings) for path in paths]
+        index[split] = (classes, samples)
+    return index
+
+
+def write_manifest(path, rows):
+    # Paths are stored relative to the manifest so the dataset folder can be moved
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["split", "target", "path"])
+        for split, target, file in rows:
+            writer.writerow([split, target, os.path.relpath(os.path.abspath(file), base)])
+
+
+def clear_clinic_folders(out, names, source):
+    # Links from an earlier split would otherwise mix with the new partition
+    source = os.path.realpath(source)
+    for name in names:
+        for split in SPLIT_NAMES:
+            folder = os.path.realpath(os.path.join(out, name, split))
+            if source == folder or source.startswith(folder + os.sep):
+                raise SystemExit(f"Refusing to clear {folder}, it contains the source dataset")
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition a dataset over N clinics")
+    parser.add_argument("--source", default="all", help="Folder with train/ and test/ ImageFolders")
+    parser.add_argument("--out", default=".", help="Where <clinic>.csv manifests (and folders) are written")
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument("--split", choices=SPLITS, default="iid")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet concentration for skewed splits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hardlink", action="store_true",
+                        help="Also build <out>/<clinic>/<split>/<class>/ folders out of hardlinks, "
+                             "replacing the <split> folders of an earlier split")
+    parser.add_argument("--workers", type=int, default=16, help="Threads for file operations")
+    args = parser.parse_args()
+
+    names = clinic_names(args.clients)
+    rows = {name: [] for name in names}
+    links = []
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        index = scan(args.source, executor)
+        # One draw of clinic proportions for both splits, so each clinic's test set matches its train set
+        label_lists = [[target for _, target in samples] for _, samples in index.values()]
+        split_parts = partition(label_lists, args.clients, args.split, alpha=args.alpha, seed=args.seed)
+        for (split, (classes, samples)), parts in zip(index.items(), split_parts):
+            for name, part in zip(names, parts):
+                for i in part:
+                    file, target = samples[i]
+                    rows[name].append((split, target, file))
+                    links.append((file, os.path.join(args.out, name, split, classes[target],
+                                                     os.path.basename(file))))
+
+        os.makedirs(args.out, exist_ok=True)
+        for name in names:
+            write_manifest(os.path.join(args.out, f"{name}.csv"), rows[name])
+
+        if args.hardlink:
+            clear_clinic_folders(args.out, names, args.source)
+            for folder in {os.path.dirname(dest) for _, dest in links}:
+                os.makedirs(folder, exist_ok=True)
+            list(executor.map(lambda pair: os.link(*pair), links))
+
+    for name in names:
+        counts = {split: sum(1 for r in rows[name] if r[0] == split) for split in SPLIT_NAMES}
+        print(f"{name}: {counts['train']} train, {counts['test']} test")
+
+
+if __name__ == "__main__":
+    main()
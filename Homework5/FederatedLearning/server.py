@@ -1,12 +1,96 @@
+import argparse
+
 import flwr as fl
+import torch
+
+from utils.cnn_model import get_model
+from utils.dataset import get_cached_test_loader
+from utils.eval import test_server
+from utils.params import parameter_keys, set_parameters
+from utils.strategies import TimedFedAvg, FedBuff, AsyncServer, aggregate_fit_metrics, make_fit_config
+
+
+def get_evaluate_fn(test_dir, num_rounds, eval_every, batch_size, include_buffers):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = get_model().to(device)
+    keys = parameter_keys(model, include_buffers=include_buffers)
+    test_loader = get_cached_test_loader(test_dir, batch_size=batch_size)
+    print(f"[Server] Cached {len(test_loader.dataset)} test images from {test_dir}")
+
+    def evaluate(server_round, parameters, config):
+        # Always evaluate the final model, otherwise only every `eval_every` rounds
+        if server_round % eval_every != 0 and server_round != num_rounds:
+            return None
+        set_parameters(model, parameters, keys)
+        accuracy = test_server(model, test_loader, device)
+        return 0.0, {"accuracy": float(accuracy)}
+
+    return evaluate
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 
 def main():
-    config = fl.server.ServerConfig(num_rounds=5)
+    parser = argparse.ArgumentParser(description="Federated server for pneumonia detection")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Number of rounds (server model updates in async mode)")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync",
+                        help="sync: FedAvg waits for every clinic, async: FedBuff applies updates as they arrive")
+    parser.add_argument("--buffer-size", type=int, default=2, help="Async: updates aggregated per server update")
+    parser.add_argument("--max-staleness", type=int, default=4, help="Async: drop updates older than this many versions")
+    parser.add_argument("--test-dir", type=str, default=None,
+                        help="Held-out ImageFolder evaluated on the server, e.g. datasets/all/test")
+    parser.add_argument("--eval-every", type=positive_int, default=1, help="Run server-side evaluation every K rounds")
+    parser.add_argument("--eval-batch-size", type=int, default=256)
+    parser.add_argument("--no-federated-eval", action="store_true",
+                        help="Skip the client evaluation round-trip after each round")
+    parser.add_argument("--local-epochs", type=int, default=1, help="Local epochs per round")
+    parser.add_argument("--max-steps", type=int, default=0, help="Local steps per round, 0 = no limit")
+    parser.add_argument("--time-budget", type=float, default=0.0,
+                        help="Seconds of local training per round, 0 = no limit")
+    parser.add_argument("--trainable-only", action="store_true",
+                        help="Clinics exchange only trainable weights (must match the clinics)")
+    args = parser.parse_args()
+
+    config = fl.server.ServerConfig(num_rounds=args.rounds)
+
+    evaluate_fn = None
+    if args.test_dir is not None:
+        if args.trainable_only:
+            # BatchNorm statistics stay on the clinics, the server model keeps those of get_model()
+            print("[Server] WARNING: --trainable-only keeps BatchNorm statistics local, server-side "
+                  "accuracy uses the initial (untrained) BatchNorm statistics and is not representative")
+        evaluate_fn = get_evaluate_fn(args.test_dir, args.rounds, args.eval_every,
+                                      args.eval_batch_size, not args.trainable_only)
+    fit_config = make_fit_config(args.local_epochs, args.max_steps, args.time_budget)
+
+    if args.mode == "async":
+        strategy = FedBuff(
+            min_available_clients=3,
+            evaluate_fn=evaluate_fn,
+            on_fit_config_fn=fit_config,
+            fit_metrics_aggregation_fn=aggregate_fit_metrics,
+            buffer_size=args.buffer_size,
+            max_staleness=args.max_staleness,
+        )
+        server = AsyncServer(client_manager=fl.server.SimpleClientManager(), strategy=strategy)
+        fl.server.start_server(server_address="0.0.0.0:8080", server=server, config=config)
+        return
 
-    strategy = fl.server.strategy.FedAvg(
+    strategy = TimedFedAvg(
         fraction_fit=1.0,
+        fraction_evaluate=0.0 if args.no_federated_eval else 1.0,
         min_fit_clients=3,
+        min_evaluate_clients=0 if args.no_federated_eval else 2,
         min_available_clients=3,
+        evaluate_fn=evaluate_fn,
+        on_fit_config_fn=fit_config,
+        fit_metrics_aggregation_fn=aggregate_fit_metrics,
     )
     fl.server.start_server(server_address="0.0.0.0:8080", strategy=strategy, config=config)
 
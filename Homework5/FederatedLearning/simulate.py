@@ -0,0 +1,181 @@
+import argparse
+import os
+import time
+
+import flwr as fl
+import torch
+import torch.multiprocessing as mp
+from flwr.common import (
+    Code, DisconnectRes, EvaluateRes, FitRes, GetParametersRes, GetPropertiesRes, Status,
+    ndarrays_to_parameters, parameters_to_ndarrays,
+)
+from flwr.server.client_proxy import ClientProxy
+from torch.utils.data import DataLoader, Subset
+
+from clinic import FlowerClient
+from utils.cnn_model import get_model
+from utils.dataset import CachedImageDataset
+from utils.params import parameter_keys
+from utils.partition import SPLITS, partition
+from utils.strategies import TimedFedAvg, FedBuff, AsyncServer, aggregate_fit_metrics, make_fit_config
+
+OK = Status(code=Code.OK, message="")
+
+# Per-worker state: one model shared by every virtual clinic the worker runs
+_worker = {}
+
+
+def _init_worker(train_set, test_set, partitions, batch_size, threads, ready):
+    torch.set_num_threads(threads)
+    model = get_model()
+    _worker.update(
+        model=model,
+        keys=parameter_keys(model),
+        train_set=train_set,
+        test_set=test_set,
+        partitions=partitions,
+        batch_size=batch_size,
+    )
+    # Released once every worker and the parent have arrived
+    ready.wait()
+
+
+def _client(cid):
+    train_idx, test_idx = _worker["partitions"][cid]
+    batch_size = _worker["batch_size"]
+    # The subsets only index into the shared tensors, nothing is copied per clinic
+    trainloader = DataLoader(Subset(_worker["train_set"], train_idx), batch_size=batch_size, shuffle=True)
+    testloader = DataLoader(Subset(_worker["test_set"], test_idx), batch_size=batch_size)
+    return FlowerClient(_worker["model"], trainloader, testloader, torch.device("cpu"), _worker["keys"])
+
+
+def _get_parameters(cid):
+    return _client(cid).get_parameters(config={})
+
+
+def _fit(cid, parameters, config):
+    return _client(cid).fit(parameters, config)
+
+
+def _evaluate(cid, parameters, config):
+    return _client(cid).evaluate(parameters, config)
+
+
+class SimClientProxy(ClientProxy):
+    """Runs a virtual clinic's FlowerClient in the process pool instead of over gRPC."""
+
+    def __init__(self, cid, pool):
+        super().__init__(str(cid))
+        self.index = cid
+        self.pool = pool
+
+    def get_properties(self, ins, timeout, group_id):
+        return GetPropertiesRes(status=OK, properties={})
+
+    def get_parameters(self, ins, timeout, group_id):
+        ndarrays = self.pool.apply(_get_parameters, (self.index,))
+        return GetParametersRes(status=OK, parameters=ndarrays_to_parameters(ndarrays))
+
+    def fit(self, ins, timeout, group_id):
+        start = time.perf_counter()
+        parameters = parameters_to_ndarrays(ins.parameters)
+        deserialise = time.perf_counter() - start
+
+        ndarrays, num_examples, metrics = self.pool.apply(_fit, (self.index, parameters, ins.config))
+
+        # Timed here like TimedClient does on a real clinic
+        serialise_start = time.perf_counter()
+        encoded = ndarrays_to_parameters(ndarrays)
+        metrics["serialise"] = time.perf_counter() - serialise_start
+        metrics["deserialise"] = deserialise
+        return FitRes(status=OK, parameters=encoded, num_examples=num_examples, metrics=metrics)
+
+    def evaluate(self, ins, timeout, group_id):
+        loss, num_examples, metrics = self.pool.apply(
+            _evaluate, (self.index, parameters_to_ndarrays(ins.parameters), ins.config))
+        return EvaluateRes(status=OK, loss=loss, num_examples=num_examples, metrics=metrics)
+
+    def reconnect(self, ins, timeout, group_id):
+        return DisconnectRes(reason="")
+
+
+def run(num_clients, args, train_set, test_set):
+    # Same clinic proportions for both splits
+    train_parts, test_parts = partition([train_set.labels.tolist(), test_set.labels.tolist()],
+                                        num_clients, args.split, alpha=args.alpha, seed=args.seed)
+    partitions = list(zip(train_parts, test_parts))
+    workers = min(args.workers, num_clients)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    ctx = mp.get_context("spawn")
+    ready = ctx.Barrier(workers + 1)
+    with ctx.Pool(workers, initializer=_init_worker,
+                  initargs=(train_set, test_set, partitions, args.batch_size, threads, ready)) as pool:
+        # Worker start-up (imports, model loading) is not part of the measured rounds
+        ready.wait()
+        # Initial parameters are fetched up front so the strategy does not ask a client in the timed run
+        initial_parameters = ndarrays_to_parameters(pool.apply(_get_parameters, (0,)))
+
+        client_manager = fl.server.SimpleClientManager()
+        for cid in range(num_clients):
+            client_manager.register(SimClientProxy(cid, pool))
+
+        fit_config = make_fit_config(args.local_epochs, args.max_steps, args.time_budget)
+        if args.mode == "async":
+            strategy = FedBuff(min_available_clients=num_clients, initial_parameters=initial_parameters,
+                               on_fit_config_fn=fit_config, fit_metrics_aggregation_fn=aggregate_fit_metrics,
+                               buffer_size=args.buffer_size, max_staleness=args.max_staleness)
+            server = AsyncServer(client_manager=client_manager, strategy=strategy)
+        else:
+            min_fit = max(1, int(num_clients * args.fraction_fit))
+            strategy = TimedFedAvg(fraction_fit=args.fraction_fit, fraction_evaluate=0.0,
+                                   min_fit_clients=min_fit, min_evaluate_clients=0,
+                                   min_available_clients=num_clients, initial_parameters=initial_parameters,
+                                   on_fit_config_fn=fit_config, fit_metrics_aggregation_fn=aggregate_fit_metrics)
+            server = fl.server.Server(client_manager=client_manager, strategy=strategy)
+        server.set_max_workers(num_clients)
+
+        start = time.perf_counter()
+        server.fit(num_rounds=args.rounds, timeout=None)
+        elapsed = time.perf_counter() - start
+    return args.rounds / elapsed * 3600
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-machine federated simulation with virtual clinics")
+    parser.add_argument("--data", type=str, default=os.path.join("datasets", "all"),
+                        help="Dataset with train/ and test/ folders, partitioned across the virtual clinics")
+    parser.add_argument("--clients", type=int, nargs="+", default=[3, 10, 30],
+                        help="Numbers of virtual clinics to simulate, one run each")
+    parser.add_argument("--split", choices=SPLITS, default="iid", help="How clinics are partitioned")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet concentration for skewed splits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Process pool size")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--local-epochs", type=int, default=1)
+    parser.add_argument("--max-steps", type=int, default=0, help="Local steps per round, 0 = no limit")
+    parser.add_argument("--time-budget", type=float, default=0.0, help="Seconds of local training, 0 = no limit")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--fraction-fit", type=float, default=1.0, help="Sync: fraction of clinics trained per round")
+    parser.add_argument("--buffer-size", type=int, default=2)
+    parser.add_argument("--max-staleness", type=int, default=4)
+    args = parser.parse_args()
+
+    # Decoded once, placed in shared memory and indexed by every worker
+    train_set = CachedImageDataset.from_folder(os.path.join(args.data, "train"))
+    test_set = CachedImageDataset.from_folder(os.path.join(args.data, "test"))
+    for ds in (train_set, test_set):
+        ds.images.share_memory_()
+        ds.labels.share_memory_()
+    print(f"[Sim] Cached {len(train_set)} train / {len(test_set)} test images in shared memory")
+
+    results = [(n, run(n, args, train_set, test_set)) for n in args.clients]
+
+    print(f"{'clients':>8}{'rounds/hour':>14}")
+    for num_clients, rounds_per_hour in results:
+        print(f"{num_clients:>8}{rounds_per_hour:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
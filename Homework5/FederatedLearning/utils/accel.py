@@ -0,0 +1,27 @@
+import contextlib
+
+import torch
+
+def prepare_model(model, channels_last=False, use_compile=False):
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    if not use_compile:
+        return model
+    # The compiled module shares its parameters with the eager one, so parameters
+    # can still be exchanged through the eager model. Keep the returned module
+    # for the whole run (FlowerClient.net) so every round reuses the same graph.
+    return torch.compile(model)
+
+
+def autocast(device, enabled):
+    if not enabled:
+        return contextlib.nullcontext()
+    # bfloat16 has the float32 exponent range, no gradient scaling is needed
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+def to_device(inputs, device, channels_last=False):
+    inputs = inputs.to(device)
+    if channels_last:
+        inputs = inputs.contiguous(memory_format=torch.channels_last)
+    return inputs
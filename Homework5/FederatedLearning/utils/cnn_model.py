@@ -1,7 +1,44 @@
+import os.path
+
+import torch
 import torch.nn as nn
 import torchvision.models as models
 
-def get_model():
+# Local weight store, created once on a machine with network access:
+#   python -m utils.cnn_model
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "weights", "resnet18_pneumonia.pt")
+
+
+def _pretrained_model():
     model = models.resnet18(pretrained=True)
     model.fc = nn.Linear(model.fc.in_features, 2)  # Binary classification
     return model
+
+
+def get_model(weights_path=WEIGHTS_PATH):
+    if not os.path.exists(weights_path):
+        # No local store, download / verify the ImageNet weights (needs network access)
+        print(f"[Model] No local weights at {os.path.abspath(weights_path)}, downloading instead. "
+              f"Create the store once with 'python -m utils.cnn_model'.")
+        return _pretrained_model()
+
+    # Memory-mapped load, no network access and no random initialisation:
+    # the model is built on the meta device and takes the loaded tensors as they are
+    state_dict = torch.load(weights_path, map_location="cpu", mmap=True, weights_only=True)
+    with torch.device("meta"):
+        model = models.resnet18()
+        model.fc = nn.Linear(model.fc.in_features, 2)
+    model.load_state_dict(state_dict, assign=True)
+    return model
+
+
+def export_weights(weights_path=WEIGHTS_PATH, seed=0):
+    # Seeded so every clinic gets the same classification head
+    torch.manual_seed(seed)
+    os.makedirs(os.path.dirname(weights_path), exist_ok=True)
+    torch.save(_pretrained_model().state_dict(), weights_path)
+    print(f"Saved weights to {os.path.abspath(weights_path)}")
+
+
+if __name__ == "__main__":
+    export_weights()
@@ -1,17 +1,120 @@
+import csv
+import json
 import os.path
 
+import torch
 from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
+from torchvision.datasets.folder import default_loader
+from torch.utils.data import DataLoader, Dataset
+
+INDEX_FILE = ".index.json"
+
+
+class IndexedImageFolder(datasets.ImageFolder):
+    """ImageFolder that caches its file listing in <root>/.index.json.
+
+    The cache is rebuilt when the modification time of a class folder changes.
+    """
+
+    def make_dataset(self, directory, class_to_idx, *args, **kwargs):
+        cache = os.path.join(directory, INDEX_FILE)
+        stamp = {c: os.stat(os.path.join(directory, c)).st_mtime_ns for c in class_to_idx}
+        try:
+            with open(cache) as f:
+                index = json.load(f)
+            if index["stamp"] == stamp:
+                return [(os.path.join(directory, path), target) for path, target in index["samples"]]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        samples = super().make_dataset(directory, class_to_idx, *args, **kwargs)
+        index = {
+            "stamp": stamp,
+            "samples": [(os.path.relpath(path, directory), target) for path, target in samples],
+        }
+        try:
+            with open(cache, "w") as f:
+                json.dump(index, f)
+        except OSError:
+            pass  # Read-only dataset, scan again next time
+        return samples
+
+
+class ManifestDataset(Dataset):
+    """One split of a clinic manifest written by datasets/split_data.py."""
+
+    def __init__(self, manifest, split, transform=None):
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, newline="") as f:
+            self.samples = [
+                (os.path.join(base, row["path"]), int(row["target"]))
+                for row in csv.DictReader(f) if row["split"] == split
+            ]
+        self.targets = [target for _, target in self.samples]
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        path, target = self.samples[idx]
+        image = default_loader(path)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, target
+
 
 def get_loaders(data_dir, batch_size=16):
+    # data_dir is either a folder with train/ and test/ ImageFolders or a manifest .csv
     transform = transforms.Compose([
         transforms.Grayscale(num_output_channels=3),
         transforms.Resize((224, 224)),
         transforms.ToTensor(),
     ])
-    train_ds = datasets.ImageFolder(os.path.join(data_dir, "train"), transform=transform)
-    test_ds = datasets.ImageFolder(os.path.join(data_dir, "test"), transform=transform)
+    if os.path.isfile(data_dir):
+        train_ds = ManifestDataset(data_dir, "train", transform=transform)
+        test_ds = ManifestDataset(data_dir, "test", transform=transform)
+    else:
+        train_ds = IndexedImageFolder(os.path.join(data_dir, "train"), transform=transform)
+        test_ds = IndexedImageFolder(os.path.join(data_dir, "test"), transform=transform)
     return (
         DataLoader(train_ds, batch_size=batch_size, shuffle=True),
         DataLoader(test_ds, batch_size=batch_size)
     )
+
+
+class CachedImageDataset(Dataset):
+    """Decoded images kept in memory as one uint8 tensor of shape (N, 1, 224, 224).
+
+    Items match the get_loaders transform: float in [0, 1], grayscale repeated to 3 channels.
+    """
+
+    def __init__(self, images, labels):
+        self.images = images
+        self.labels = labels
+
+    @classmethod
+    def from_folder(cls, root):
+        transform = transforms.Compose([
+            transforms.Grayscale(num_output_channels=1),
+            transforms.Resize((224, 224)),
+            transforms.PILToTensor(),
+        ])
+        folder = IndexedImageFolder(root, transform=transform)
+        images = torch.empty((len(folder), 1, 224, 224), dtype=torch.uint8)
+        labels = torch.tensor(folder.targets, dtype=torch.long)
+        for i in range(len(folder)):
+            images[i] = folder[i][0]
+        return cls(images, labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        image = self.images[idx].float().div_(255).expand(3, -1, -1)
+        return image, self.labels[idx]
+
+
+def get_cached_test_loader(test_dir, batch_size=256):
+    # Decoded once, every evaluation afterwards only reads from memory
+    return DataLoader(CachedImageDataset.from_folder(test_dir), batch_size=batch_size)
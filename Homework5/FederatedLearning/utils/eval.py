@@ -1,13 +1,15 @@
 import torch
 
-def test(model, dataloader, device):
+from .accel import autocast, to_device
+
+def test(model, dataloader, device, amp=False, channels_last=False):
     model.eval()
     correct = 0
     total = 0
 
-    with torch.no_grad():
+    with torch.inference_mode(), autocast(device, amp):
         for inputs, labels in dataloader:
-            inputs, labels = inputs.to(device), labels.to(device)
+            inputs, labels = to_device(inputs, device, channels_last), labels.to(device)
             outputs = model(inputs)
             _, predicted = torch.max(outputs, 1)
             correct += (predicted == labels).sum().item()
@@ -17,16 +19,16 @@ def test(model, dataloader, device):
     return accuracy
 
 
-def test_server(model, test_loader, device):
+def test_server(model, test_loader, device, amp=False, channels_last=False):
     model.to(device)
     model.eval()
 
     correct = 0
     total = 0
 
-    with torch.no_grad():
+    with torch.inference_mode(), autocast(device, amp):
         for inputs, labels in test_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
+            inputs, labels = to_device(inputs, device, channels_last), labels.to(device)
             outputs = model(inputs)
             _, predicted = torch.max(outputs, 1)
             correct += (predicted == labels).sum().item()
@@ -34,4 +36,4 @@ def test_server(model, test_loader, device):
 
     accuracy = correct / total if total > 0 else 0
     print(f"[Server] Global Test Accuracy: {accuracy:.4f}")
-    return accuracy
\ No newline at end of file
+    return accuracy
@@ -0,0 +1,36 @@
+import warnings
+
+import torch
+
+
+def parameter_keys(model, include_buffers=True):
+    # Fixed exchange order, computed once per model.
+    # Integer buffers (BatchNorm num_batches_tracked) are never exchanged,
+    # averaging step counters is meaningless.
+    trainable = {name for name, _ in model.named_parameters()}
+    keys = []
+    for name, tensor in model.state_dict().items():
+        if name in trainable:
+            keys.append(name)
+        elif include_buffers and tensor.is_floating_point():
+            keys.append(name)
+    return keys
+
+
+def get_parameters(model, keys):
+    # On CPU .numpy() is a view of the parameter storage, no copy is made
+    state_dict = model.state_dict()
+    return [state_dict[k].detach().cpu().numpy() for k in keys]
+
+
+def set_parameters(model, parameters, keys):
+    if len(parameters) != len(keys):
+        raise ValueError(f"Expected {len(keys)} arrays, got {len(parameters)}")
+
+    state_dict = model.state_dict()
+    with torch.no_grad(), warnings.catch_warnings():
+        # Arrays deserialised by Flower are read-only, we only read from them
+        warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+        for k, v in zip(keys, parameters):
+            # Copy in place into the existing storage instead of rebuilding the state dict
+            state_dict[k].copy_(torch.from_numpy(v).reshape(state_dict[k].shape))
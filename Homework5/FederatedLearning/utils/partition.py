@@ -0,0 +1,51 @@
+import numpy as np
+
+SPLITS = ("iid", "dirichlet", "quantity")
+
+
+def _cut(indices, proportions):
+    cuts = (np.cumsum(proportions) * len(indices)).astype(int)[:-1]
+    return np.split(indices, cuts)
+
+
+def draw_proportions(classes, num_clients, method="iid", alpha=0.5, rng=None):
+    """Share of every class each clinic receives, {class: array of num_clients fractions}."""
+    if method == "iid":
+        shares = np.full(num_clients, 1.0 / num_clients)
+        return {c: shares for c in classes}
+    if method == "quantity":
+        # Quantity skew: clinic sizes drawn from Dir(alpha), the same for every class
+        shares = rng.dirichlet([alpha] * num_clients)
+        return {c: shares for c in classes}
+    if method == "dirichlet":
+        # Label skew: every class is spread over the clinics with its own Dir(alpha) proportions
+        return {c: rng.dirichlet([alpha] * num_clients) for c in classes}
+    raise ValueError(f"Unknown split '{method}', expected one of {SPLITS}")
+
+
+def apply_proportions(labels, proportions, rng):
+    labels = np.asarray(labels)
+    parts = [[] for _ in range(len(next(iter(proportions.values()))))]
+    for label, shares in proportions.items():
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        for cid, chunk in enumerate(_cut(indices, shares)):
+            parts[cid].extend(chunk)
+    return parts
+
+
+def partition(label_lists, num_clients, method="iid", alpha=0.5, seed=0, min_size=1, max_tries=100):
+    """Split several label lists (e.g. train and test) over `num_clients` with the same proportions.
+
+    Returns one list per label list, holding a sorted index list per clinic, so a clinic's
+    test split has the size share and label mix of its train split.
+    """
+    rng = np.random.default_rng(seed)
+    classes = sorted({int(label) for labels in label_lists for label in labels})
+    for _ in range(max_tries):
+        proportions = draw_proportions(classes, num_clients, method, alpha, rng)
+        splits = [apply_proportions(labels, proportions, rng) for labels in label_lists]
+        # Skewed draws can leave a clinic (almost) empty, draw again
+        if all(min(len(p) for p in parts) >= min_size for parts in splits):
+            return [[sorted(int(i) for i in p) for p in parts] for parts in splits]
+    raise ValueError(f"Could not give every clinic {min_size} samples with '{method}' "
+                     f"(alpha={alpha}), use a larger alpha or fewer clinics")
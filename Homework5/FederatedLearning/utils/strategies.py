@@ -0,0 +1,217 @@
+import concurrent.futures
+import time
+
+import flwr as fl
+from flwr.common import Code, FitIns, ndarrays_to_parameters, parameters_to_ndarrays
+from flwr.server.history import History
+
+
+PHASES = ["deserialise", "param_copy_in", "data_wait", "forward", "backward", "param_copy_out", "serialise"]
+
+
+def make_fit_config(local_epochs=1, max_steps=0, time_budget=0.0):
+    """on_fit_config_fn sending the local training limits, 0 meaning no limit."""
+
+    def fit_config(server_round):
+        return {"local_epochs": local_epochs, "max_steps": max_steps, "time_budget": time_budget}
+
+    return fit_config
+
+
+def aggregate_fit_metrics(fit_metrics):
+    """Mean and max of every client timing, and the summed throughput of the round."""
+    aggregated = {}
+    keys = {k for _, metrics in fit_metrics for k in metrics}
+    for key in sorted(keys):
+        values = [metrics[key] for _, metrics in fit_metrics if key in metrics]
+        aggregated[f"{key}_mean"] = sum(values) / len(values)
+        aggregated[f"{key}_max"] = max(values)
+    if "samples_per_sec" in keys:
+        aggregated["samples_per_sec_total"] = sum(m.get("samples_per_sec", 0.0) for _, m in fit_metrics)
+    return aggregated
+
+
+def format_profile(metrics):
+    parts = [f"{p} {metrics[p + '_mean']:.2f}s" for p in PHASES if p + "_mean" in metrics]
+    if "samples_per_sec_total" in metrics:
+        parts.append(f"{metrics['samples_per_sec_total']:.1f} samples/s")
+    return ", ".join(parts)
+
+
+class TimedFedAvg(fl.server.strategy.FedAvg):
+    """FedAvg that reports the wall-clock time of every round in its fit metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._start = None
+        self._round_start = None
+
+    def configure_fit(self, server_round, parameters, client_manager):
+        self._round_start = time.perf_counter()
+        if self._start is None:
+            self._start = self._round_start
+        return super().configure_fit(server_round, parameters, client_manager)
+
+    def aggregate_fit(self, server_round, results, failures):
+        parameters, metrics = super().aggregate_fit(server_round, results, failures)
+        now = time.perf_counter()
+        metrics["round_time"] = now - self._round_start
+        metrics["wall_clock"] = now - self._start
+        if "fit_time_max" in metrics:
+            # Time the round spent outside the slowest clinic's fit: communication and scheduling
+            metrics["overhead"] = metrics["round_time"] - metrics["fit_time_max"]
+        print(f"[Server] Round {server_round}: {metrics['round_time']:.1f}s "
+              f"(total {metrics['wall_clock']:.1f}s)")
+        if "fit_time_max" in metrics:
+            print(f"[Server]   slowest fit {metrics['fit_time_max']:.1f}s, overhead {metrics['overhead']:.1f}s; "
+                  f"mean {format_profile(metrics)}")
+        return parameters, metrics
+
+
+class FedBuff(fl.server.strategy.FedAvg):
+    """Buffered asynchronous aggregation (FedBuff), driven by AsyncServer.
+
+    Client updates are applied as deltas once `buffer_size` of them have arrived,
+    each weighted by num_examples / (1 + staleness) ** staleness_exponent.
+    Updates older than `max_staleness` server versions are dropped.
+    """
+
+    def __init__(self, *args, buffer_size=2, max_staleness=4, staleness_exponent=0.5,
+                 server_lr=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer_size = buffer_size
+        self.max_staleness = max_staleness
+        self.staleness_exponent = staleness_exponent
+        self.server_lr = server_lr
+
+    def staleness_weight(self, num_examples, staleness):
+        return num_examples / (1 + staleness) ** self.staleness_exponent
+
+    def aggregate_buffer(self, global_ndarrays, buffer):
+        # buffer: list of (delta ndarrays, num_examples, staleness)
+        weights = [self.staleness_weight(n, s) for _, n, s in buffer]
+        total = sum(weights)
+        new_ndarrays = []
+        for i, param in enumerate(global_ndarrays):
+            delta = sum(w * update[0][i] for w, update in zip(weights, buffer)) / total
+            new_ndarrays.append((param + self.server_lr * delta).astype(param.dtype))
+        return new_ndarrays
+
+
+class AsyncServer(fl.server.Server):
+    """Server that keeps every client busy and lets FedBuff aggregate as updates arrive.
+
+    One "round" is one server model update, so `num_rounds` counts aggregations.
+    Only centralised evaluation is run, a client evaluation would have to wait for its fit.
+    Clients are looked up in the client manager on every dispatch, so clinics that
+    (re)connect mid-run are picked up; a failed client is retried after `retry_delay` seconds.
+    """
+
+    poll_interval = 1.0
+    retry_delay = 5.0
+
+    def fit(self, num_rounds, timeout):
+        history = History()
+        strategy = self.strategy
+
+        self.parameters = self._get_initial_parameters(server_round=0, timeout=timeout)
+        self._evaluate_centralized(history, 0)
+
+        self._client_manager.wait_for(strategy.min_available_clients)
+
+        version = 0
+        # Model of every version a client may still be training on, needed for its delta
+        snapshots = {0: parameters_to_ndarrays(self.parameters)}
+        buffer = []
+        pending = {}
+        retry_at = {}
+        start = time.perf_counter()
+        round_start = start
+
+        def dispatch_idle(executor):
+            busy = {client.cid for client, _ in pending.values()}
+            now = time.perf_counter()
+            config = strategy.on_fit_config_fn(version + 1) if strategy.on_fit_config_fn else {}
+            for cid, client in self._client_manager.all().items():
+                if cid in busy or retry_at.get(cid, 0.0) > now:
+                    continue
+                ins = FitIns(self.parameters, config)
+                future = executor.submit(client.fit, ins, timeout=timeout, group_id=version)
+                pending[future] = (client, version)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        dispatch_idle(executor)
+
+        while version < num_rounds:
+            if not pending:
+                # Every client failed or left, wait for one to come back
+                time.sleep(self.poll_interval)
+            # Wake up regularly even when nothing finishes, to pick up new and retried clients
+            done, _ = concurrent.futures.wait(
+                pending, timeout=self.poll_interval, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                client, base_version = pending.pop(future)
+                try:
+                    res = future.result()
+                    failure = None if res.status.code == Code.OK else res.status.message
+                except Exception as e:
+                    failure = e
+                if failure is not None:
+                    # Retried later if it is still connected, a restarted clinic comes back as a new proxy
+                    print(f"[Server] Client {client.cid} failed: {failure}")
+                    retry_at[client.cid] = time.perf_counter() + self.retry_delay
+                    continue
+
+                staleness = version - base_version
+                if staleness > strategy.max_staleness:
+                    print(f"[Server] Dropped update from {client.cid}, staleness {staleness}")
+                else:
+                    base = snapshots[base_version]
+                    delta = [p - b for p, b in zip(parameters_to_ndarrays(res.parameters), base)]
+                    buffer.append((delta, res.num_examples, staleness, client, res))
+
+                if len(buffer) >= strategy.buffer_size and version < num_rounds:
+                    version = self._apply_buffer(history, version, snapshots, buffer, start, round_start)
+                    buffer = []
+                    round_start = time.perf_counter()
+
+            if version < num_rounds:
+                dispatch_idle(executor)
+
+        # Measured before the stragglers are waited for, their updates are discarded
+        elapsed = time.perf_counter() - start
+        executor.shutdown(wait=True)
+        return history, elapsed
+
+    def _apply_buffer(self, history, version, snapshots, buffer, start, round_start):
+        strategy = self.strategy
+        new_ndarrays = strategy.aggregate_buffer(snapshots[version], [b[:3] for b in buffer])
+        version += 1
+        self.parameters = ndarrays_to_parameters(new_ndarrays)
+        snapshots[version] = new_ndarrays
+        for old in [v for v in snapshots if v < version - strategy.max_staleness]:
+            del snapshots[old]
+
+        now = time.perf_counter()
+        metrics = {}
+        if strategy.fit_metrics_aggregation_fn:
+            metrics = strategy.fit_metrics_aggregation_fn([(res.num_examples, res.metrics) for *_, res in buffer])
+        metrics["round_time"] = now - round_start
+        metrics["wall_clock"] = now - start
+        metrics["num_updates"] = len(buffer)
+        metrics["mean_staleness"] = sum(b[2] for b in buffer) / len(buffer)
+        history.add_metrics_distributed_fit(server_round=version, metrics=metrics)
+        print(f"[Server] Round {version}: {metrics['round_time']:.1f}s (total {metrics['wall_clock']:.1f}s), "
+              f"{len(buffer)} updates, mean staleness {metrics['mean_staleness']:.2f}")
+        if "fit_time_max" in metrics:
+            print(f"[Server]   mean {format_profile(metrics)}")
+
+        self._evaluate_centralized(history, version)
+        return version
+
+    def _evaluate_centralized(self, history, server_round):
+        res = self.strategy.evaluate(server_round, parameters=self.parameters)
+        if res is not None:
+            loss, metrics = res
+            history.add_loss_centralized(server_round=server_round, loss=loss)
+            history.add_metrics_centralized(server_round=server_round, metrics=metrics)
@@ -1,11 +1,45 @@
+import time
+
 import torch.nn.functional as F
 
-def train(model, loader, optimizer, device):
+from .accel import autocast, to_device
+
+def train(model, loader, optimizer, device, amp=False, channels_last=False,
+          epochs=1, max_steps=None, time_budget=None):
+    # Stops mid-epoch once `max_steps` steps or `time_budget` seconds are used up.
+    # Phase timings are wall-clock, on CUDA they only hold with synchronous kernels.
     model.train()
-    for images, labels in loader:
-        images, labels = images.to(device), labels.to(device)
-        optimizer.zero_grad()
-        output = model(images)
-        loss = F.cross_entropy(output, labels)
-        loss.backward()
-        optimizer.step()
\ No newline at end of file
+    stats = {"data_wait": 0.0, "forward": 0.0, "backward": 0.0, "steps": 0, "samples": 0,
+             "stopped_early": False}
+    start = tick = time.perf_counter()
+
+    for _ in range(epochs):
+        for images, labels in loader:
+            images, labels = to_device(images, device, channels_last), labels.to(device)
+            loaded = time.perf_counter()
+
+            optimizer.zero_grad()
+            with autocast(device, amp):
+                output = model(images)
+                loss = F.cross_entropy(output, labels)
+            forwarded = time.perf_counter()
+            loss.backward()
+            optimizer.step()
+            stepped = time.perf_counter()
+
+            stats["data_wait"] += loaded - tick
+            stats["forward"] += forwarded - loaded
+            stats["backward"] += stepped - forwarded  # includes the optimizer step
+            stats["steps"] += 1
+            stats["samples"] += labels.size(0)
+            tick = stepped
+
+            if (max_steps and stats["steps"] >= max_steps) or (time_budget and tick - start >= time_budget):
+                stats["stopped_early"] = True
+                break
+        if stats["stopped_early"]:
+            break
+
+    stats["train_time"] = time.perf_counter() - start
+    stats["samples_per_sec"] = stats["samples"] / stats["train_time"] if stats["train_time"] > 0 else 0.0
+    return stats